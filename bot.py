@@ -20,18 +20,26 @@ async def health():
 
 # ──────────────────────  Библиотеки  ──────────────────────
 import os
-import json
+import sys
 import random
 import datetime
+import time
 import pathlib
 import logging
 import html
 import asyncio
+import collections
+import copy
+import heapq
+import functools
 from functools import wraps
+from typing import Awaitable, Callable
 from error_handler import universal_error_handler
 
+import orjson
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -51,6 +59,7 @@ logger = logging.getLogger(__name__)
 # ──────────────────────  Конфигурация  ──────────────────────
 BASE = pathlib.Path(__file__).parent
 PHOTOS_DIR = BASE / "places"
+MAP_PATH = BASE / "MapNewYork.png"
 RULES_PATH = BASE / "rules.txt"
 
 load_dotenv(BASE / ".env")          # .env → BOT_TOKEN, ADMIN_ID
@@ -59,13 +68,37 @@ ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
 CFG_PATH = BASE / "config.json"
 STATE_PATH = BASE / "game_state.json"
+PHOTO_IDS_PATH = BASE / "photo_ids.json"   # имя файла фото → Telegram file_id
+# фрагменты BadRequest.message об устаревшем/чужом file_id
+# ("Wrong file identifier/http url specified", "Wrong remote file identifier specified: …")
+FILE_ID_ERROR_MARKERS = ("file identifier", "file_id", "file reference")
+
+# ключ кэша разобранного game_state.json в bot_data
+STATE_CACHE_KEY = "state_cache"
+
+# упорядочивают фоновые записи/удаление game_state.json и photo_ids.json
+STATE_LOCK = asyncio.Lock()
+PHOTO_IDS_LOCK = asyncio.Lock()
+# выдаёт «окна» общего лимита отправки (см. _global_send_slot)
+SEND_LOCK = asyncio.Lock()
+
+# лимиты Telegram на личные сообщения (см. queue_message)
+GLOBAL_SEND_RATE = 30                # сообщений в секунду на бота
+CHAT_SEND_INTERVAL = 1.0             # секунд между сообщениями в один чат
+SEND_DRAIN_TIMEOUT = 10.0            # секунд на досылку очереди при остановке
+
+# неактивность игроков (см. check_all_inactive)
+INACTIVITY_LIMIT = 7 * 86400                    # секунд; после – предупреждение игроку
+INACTIVITY_CHECK_INTERVAL = 3600                # секунд между проверками
 
 # Список слов (нормализуется к нижнему регистру)
-WORDS = {
+WORDS = frozenset(
     w.strip().lower()
     for w in (BASE / "New_rus.txt").read_text(encoding="utf-8").split()
     if w.strip()
-}
+)
+# Вариант в верхнем регистре – ввод игрока уже приводится к upper()
+WORDS_UPPER = frozenset(map(str.upper, WORDS))
 
 # Текст правил – разбит на сообщения по 4096 символов
 if RULES_PATH.is_file():
@@ -80,38 +113,177 @@ else:
 # ──────────────────────  Утилиты  ──────────────────────
 def load_json(path: pathlib.Path) -> dict:
     """Читает JSON‑файл, при отсутствии создаёт пустой словарь."""
-    return json.load(path.open(encoding="utf-8")) if path.is_file() else {}
+    return orjson.loads(path.read_bytes()) if path.is_file() else {}
+
+
+def load_json_cached(path: pathlib.Path, cache_key: str, ctx: ContextTypes.DEFAULT_TYPE) -> dict:
+    """
+    Как ``load_json``, но хранит разобранный JSON в ``bot_data[cache_key]``
+    в виде ``(mtime_ns, dict)`` и перечитывает файл только при смене mtime.
+    Отсутствующему файлу соответствует mtime ``None``.
+    """
+    try:
+        mtime = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    cached = ctx.bot_data.get(cache_key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    data = load_json(path)
+    ctx.bot_data[cache_key] = (mtime, data)
+    return data
+
+
+def load_cfg() -> dict:
+    """
+    Читает конфиг игры; помимо списка ``buildings`` добавляет индекс
+    ``buildings_by_id``. Загружается один раз при старте в ``bot_data["cfg"]``
+    и перечитывается админом через /reload.
+    """
+    cfg = load_json(CFG_PATH)
+    cfg["buildings_by_id"] = {b["id"]: b for b in cfg.get("buildings", [])}
+    return cfg
+
+
+def load_state(ctx: ContextTypes.DEFAULT_TYPE) -> dict:
+    """
+    Состояние игры. В памяти здания хранятся только в ``buildings_by_id``
+    (id → динамические данные); в список ``buildings`` они превращаются
+    обратно лишь при записи на диск (см. ``save_state``).
 
+    Пока есть незавершённые фоновые записи, mtime файла уже может
+    смениться (os.replace), а кэш ещё хранит старый – в это время
+    отдаём кэш без stat, иначе перечитали бы свой же снимок.
+    """
+    cached = ctx.bot_data.get(STATE_CACHE_KEY)
+    if cached and ctx.bot_data.get("state_pending_writes"):
+        return cached[1]
+    state = load_json_cached(STATE_PATH, STATE_CACHE_KEY, ctx)
+    if "buildings_by_id" not in state:
+        state["buildings_by_id"] = {d["id"]: d for d in state.pop("buildings", [])}
+    return state
+
+
+def _fsync(fd: int) -> None:
+    """fsync, на macOS – F_FULLFSYNC (обычный fsync там не сбрасывает кэш диска)."""
+    if sys.platform == "darwin":
+        import fcntl
+        fcntl.fcntl(fd, fcntl.F_FULLFSYNC)
+    else:
+        os.fsync(fd)
+
+
+def write_json_atomic(path: pathlib.Path, data: dict) -> int:
+    """
+    Атомарно записывает JSON, возвращает mtime_ns нового файла.
+
+    Порядок: write → flush → fsync(файл) → rename → fsync(каталог), чтобы
+    после сбоя питания на диске была либо старая, либо новая версия.
+    """
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+        f.flush()
+        _fsync(f.fileno())
+    os.replace(tmp, path)
+
+    if os.name != "nt":                # каталог на Windows не открыть через os.open
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return path.stat().st_mtime_ns
+
+
+def save_state(state: dict) -> int:
+    """Атомарно сохраняет состояние игры, возвращает mtime_ns нового файла."""
+    data = dict(state)
+    if "buildings_by_id" in data:
+        data["buildings"] = list(data.pop("buildings_by_id").values())
+    return write_json_atomic(STATE_PATH, data)
+
+
+def persist_state(state: dict, ctx: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Сохраняет состояние в фоне, не блокируя event loop.
+
+    Источник истины – ``state`` в памяти (он же лежит в кэше ``bot_data``);
+    на диск пишется его снимок в отдельном потоке. Записи выполняются
+    строго по очереди под ``STATE_LOCK``.
+    """
+    snapshot = copy.deepcopy(state)
+    cached = ctx.bot_data.get(STATE_CACHE_KEY)
+    ctx.bot_data[STATE_CACHE_KEY] = (cached[0] if cached else None, state)
+    ctx.bot_data["state_pending_writes"] = ctx.bot_data.get("state_pending_writes", 0) + 1
+
+    async def _save() -> None:
+        try:
+            async with STATE_LOCK:
+                mtime = await asyncio.to_thread(save_state, snapshot)
+            ctx.bot_data[STATE_CACHE_KEY] = (mtime, state)
+        finally:
+            ctx.bot_data["state_pending_writes"] -= 1
 
-def save_state(state: dict) -> None:
-    """Атомарно сохраняет состояние игры."""
-    tmp = STATE_PATH.with_suffix(".tmp")
-    json.dump(state, tmp.open("w", encoding="utf-8"), ensure_ascii=False, indent=2)
-    tmp.replace(STATE_PATH)
+    ctx.application.create_task(_save())
 
 
-def compare_word(guess: str, target: str) -> list[str]:
-    """Возвращает список цветов (green, yellow, gray) для сравнения guess‑target."""
+def persist_photo_ids(ctx: ContextTypes.DEFAULT_TYPE) -> None:
+    """Сохраняет кэш ``file_id`` фотографий в фоне (см. ``persist_state``)."""
+    snapshot = dict(ctx.bot_data["photo_ids"])
+
+    async def _save() -> None:
+        async with PHOTO_IDS_LOCK:
+            await asyncio.to_thread(write_json_atomic, PHOTO_IDS_PATH, snapshot)
+
+    ctx.application.create_task(_save())
+
+
+def compare_word(guess: str, target: str) -> str:
+    """
+    Сравнивает guess с target и возвращает строку кодов цветов:
+    ``G`` – green (буква на месте), ``Y`` – yellow (есть в слове), ``X`` – gray.
+    """
     guess, target = guess.upper(), target.upper()
-    res = ["gray"] * len(guess)
-    remaining = []
+    res = ["X"] * len(guess)
+    counts: dict[str, int] = {}       # сколько раз буква цели осталась неугаданной
 
-    for i, ch in enumerate(guess):
-        if ch == target[i]:
-            res[i] = "green"
+    for i, (g, t) in enumerate(zip(guess, target)):
+        if g == t:
+            res[i] = "G"
         else:
-            remaining.append(target[i])
+            counts[t] = counts.get(t, 0) + 1
+
+    for i, g in enumerate(guess):
+        if res[i] == "X" and counts.get(g, 0) > 0:
+            res[i] = "Y"
+            counts[g] -= 1
+    return "".join(res)
+
+
+def score_from(colours: str) -> int:
+    """Считает очки: 10 за green (G), 5 за yellow (Y), 0 за gray (X)."""
+    return colours.count("G") * 10 + colours.count("Y") * 5
+
 
-    for i, ch in enumerate(guess):
-        if res[i] == "gray" and ch in remaining:
-            res[i] = "yellow"
-            remaining.remove(ch)
-    return res
+# коды цветов compare_word → эмодзи‑квадраты
+_VIS_TABLE = str.maketrans({"G": "🟩", "Y": "🟨", "X": "⬜"})
 
 
-def score_from(colours: list[str]) -> int:
-    """Считает очки: 10 за green, 5 за yellow, 0 за gray."""
-    return sum(10 if c == "green" else 5 if c == "yellow" else 0 for c in colours)
+def render_colours(colours: str) -> str:
+    """Превращает строку кодов цветов в строку из эмодзи‑квадратов."""
+    return colours.translate(_VIS_TABLE)
+
+
+def format_time(ts: int | str) -> str:
+    """Дата попытки (unix‑время UTC; в старых записях – ISO‑строка) для показа."""
+    if isinstance(ts, str):
+        dt = datetime.datetime.fromisoformat(ts)
+    else:
+        dt = datetime.datetime.fromtimestamp(ts, datetime.timezone.utc)
+    return dt.strftime("%d.%m.%Y %H:%M")
 
 
 # ──────────────────────  Ответ клиенту  ──────────────────────
@@ -125,13 +297,68 @@ async def reply(update: Update, text: str, **kwargs) -> None:
         logger.warning("reply() called without a target: %s", text)
 
 
+async def send_with_retry(send: Callable[[], Awaitable]):
+    """
+    Выполняет отправку ``send()``; если Telegram ответил 429 (``RetryAfter``),
+    ждёт указанное время и повторяет. Паузы делаются только по факту 429.
+    """
+    try:
+        return await send()
+    except RetryAfter as e:
+        delay = e.retry_after
+        if isinstance(delay, datetime.timedelta):
+            delay = delay.total_seconds()
+        logger.warning("Flood control: повтор через %s с", delay)
+        await asyncio.sleep(delay)
+        return await send()
+
+
+async def send_cached_photo(
+    send: Callable[..., Awaitable],
+    path: pathlib.Path,
+    ctx: ContextTypes.DEFAULT_TYPE,
+    **kwargs,
+):
+    """
+    Отправляет фото через ``send(photo=..., **kwargs)``.
+
+    Если для файла уже есть Telegram ``file_id`` – шлём его (без загрузки
+    файла); иначе загружаем с диска и запоминаем ``file_id`` из ответа.
+    """
+    photo_ids = ctx.bot_data["photo_ids"]
+    file_id = photo_ids.get(path.name)
+    if file_id:
+        try:
+            return await send(photo=file_id, **kwargs)
+        except BadRequest as e:
+            # загрузка заново помогает только при устаревшем file_id (например,
+            # сменился токен бота); прочие BadRequest (подпись, разметка, чат) – наверх
+            msg = e.message.lower()
+            if not any(marker in msg for marker in FILE_ID_ERROR_MARKERS):
+                raise
+            logger.warning("Устаревший file_id для %s, загружаем файл", path.name)
+            photo_ids.pop(path.name, None)
+
+    msg = await send(photo=str(path), **kwargs)
+    photo_ids[path.name] = msg.photo[-1].file_id
+    persist_photo_ids(ctx)
+    return msg
+
+
 # ──────────────────────  Декораторы  ──────────────────────
+async def deny(upd: Update, text: str):
+    """Отказ в доступе: сообщение + ответ на callback, чтобы кнопка не «висела»."""
+    await reply(upd, text)
+    if upd.callback_query:
+        await upd.callback_query.answer()
+
+
 def admin_only(func):
     """Разрешает вызов функции только администратору."""
     @wraps(func)
     async def wrapper(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         if upd.effective_user.id != ctx.bot_data["admin_id"]:
-            await reply(upd, "❌ Доступ только у админа")
+            await deny(upd, "❌ Доступ только у админа")
             return
         return await func(upd, ctx)
 
@@ -144,10 +371,10 @@ def active_player(func):
     async def wrapper(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         uid = str(upd.effective_user.id)
         if uid not in ctx.bot_data["players"]:
-            await reply(upd, "❗️ Сначала /join")
+            await deny(upd, "❗️ Сначала /join")
             return
         if not ctx.bot_data.get("state_game_active"):
-            await reply(upd, "⚠️ Игра ещё не началась")
+            await deny(upd, "⚠️ Игра ещё не началась")
             return
         return await func(upd, ctx)
 
@@ -167,10 +394,10 @@ def player_or_admin(func):
         # fallback к проверке active_player
         uid = str(upd.effective_user.id)
         if uid not in ctx.bot_data["players"]:
-            await reply(upd, "❗️ Сначала /join")
+            await deny(upd, "❗️ Сначала /join")
             return
         if not ctx.bot_data.get("state_game_active"):
-            await reply(upd, "⚠️ Игра ещё не началась")
+            await deny(upd, "⚠️ Игра ещё не началась")
             return
         return await func(upd, ctx)
 
@@ -178,6 +405,74 @@ def player_or_admin(func):
 
 
 # ──────────────────────  Очередь и уведомления  ──────────────────────
+def queue_message(ctx: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str) -> None:
+    """
+    Ставит личное сообщение в очередь отправки чата ``chat_id``.
+
+    У каждого чата своя очередь и (пока в ней есть сообщения) своя задача
+    ``_chat_sender``, поэтому пауза CHAT_SEND_INTERVAL в одном чате не
+    задерживает сообщения другим игрокам.
+    """
+    outbox = ctx.bot_data["chat_outbox"]
+    pending = outbox.setdefault(chat_id, collections.deque())
+    pending.append(text)
+    if len(pending) == 1:                      # отправителя для чата ещё нет
+        tasks = ctx.bot_data["send_tasks"]
+        task = asyncio.create_task(_chat_sender(ctx.application, chat_id, pending))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+
+async def _global_send_slot(app) -> None:
+    """Ждёт свободного «окна» общего лимита GLOBAL_SEND_RATE сообщений/с на бота."""
+    loop = asyncio.get_running_loop()
+    async with SEND_LOCK:
+        wait = app.bot_data["send_next_global"] - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        app.bot_data["send_next_global"] = loop.time() + 1 / GLOBAL_SEND_RATE
+
+
+async def _chat_sender(app, chat_id: int, pending: collections.deque) -> None:
+    """
+    Отправляет сообщения одного чата по порядку, не чаще раза в
+    CHAT_SEND_INTERVAL секунд, и завершается, когда очередь опустела.
+    """
+    loop = asyncio.get_running_loop()
+    last_send = app.bot_data["chat_last_send"]
+    while pending:
+        wait = last_send.get(chat_id, float("-inf")) + CHAT_SEND_INTERVAL - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        await _global_send_slot(app)
+        text = pending[0]
+        try:
+            await send_with_retry(lambda: app.bot.send_message(chat_id=chat_id, text=text))
+        except Exception:
+            logger.exception("Не удалось отправить сообщение в чат %s", chat_id)
+        last_send[chat_id] = loop.time()
+        pending.popleft()
+    app.bot_data["chat_outbox"].pop(chat_id, None)
+
+
+async def drain_send_tasks(app) -> None:
+    """
+    Дожидается отправки уже поставленных в очередь сообщений (не дольше
+    SEND_DRAIN_TIMEOUT), оставшиеся задачи отменяет. Вызывается из
+    ``post_stop``, пока бот ещё может отправлять сообщения.
+    """
+    tasks = set(app.bot_data["send_tasks"])
+    if not tasks:
+        return
+    _, not_done = await asyncio.wait(tasks, timeout=SEND_DRAIN_TIMEOUT)
+    if not_done:
+        dropped = sum(len(q) for q in app.bot_data["chat_outbox"].values())
+        logger.warning("Остановка: не отправлено уведомлений – %s", dropped)
+        for task in not_done:
+            task.cancel()
+        await asyncio.gather(*not_done, return_exceptions=True)
+
+
 def advance_queue(ctx: ContextTypes.DEFAULT_TYPE) -> None:
     """Перемещает текущего игрока в конец очереди и уведомляет следующего."""
     q = ctx.bot_data["queue"]
@@ -187,12 +482,7 @@ def advance_queue(ctx: ContextTypes.DEFAULT_TYPE) -> None:
     ctx.bot_data["state_game_active"] = True
     next_uid = q[0]
     username = ctx.bot_data["players"][next_uid]["username"]
-    ctx.application.create_task(
-        ctx.application.bot.send_message(
-            chat_id=int(next_uid),
-            text=f"⏳ Ваш ход, @{username}! /menu – ваши возможности",
-        )
-    )
+    queue_message(ctx, int(next_uid), f"⏳ Ваш ход, @{username}! /menu – ваши возможности")
 
 
 def notify_current_player(ctx: ContextTypes.DEFAULT_TYPE) -> None:
@@ -201,41 +491,88 @@ def notify_current_player(ctx: ContextTypes.DEFAULT_TYPE) -> None:
         return
     uid = ctx.bot_data["queue"][0]
     username = ctx.bot_data["players"][uid]["username"]
-    ctx.application.create_task(
-        ctx.application.bot.send_message(
-            chat_id=int(uid),
-            text=f"⏳ Ваш ход, @{username}! /menu – ваши возможности",
-        )
-    )
+    queue_message(ctx, int(uid), f"⏳ Ваш ход, @{username}! /menu – ваши возможности")
 
 
-def check_inactivity(uid: str, ctx: ContextTypes.DEFAULT_TYPE) -> None:
-    """Если игрок был неактивен >7 дней – отправляем предупреждение."""
+def check_inactivity(uid: str, ctx: ContextTypes.DEFAULT_TYPE, now: float | None = None) -> None:
+    """
+    Если игрок был неактивен >7 дней – отправляем предупреждение
+    (один раз, пока игрок снова не сделает ход).
+    """
     player = ctx.bot_data["players"].get(uid)
-    if not player:
+    if not player or player.get("inactivity_warned"):
         return
-    last = datetime.datetime.fromisoformat(player["last_active"])
-    if datetime.datetime.utcnow() - last > datetime.timedelta(days=7):
-        ctx.application.create_task(
-            ctx.application.bot.send_message(
-                chat_id=int(uid),
-                text=(
-                    "⚠️ Вы не делали ход более недели. "
-                    "Появится риск исключения из игры."
-                ),
-            )
+    # last_active – unix‑время (int), сравнение без разбора дат
+    if (now or time.time()) - player["last_active"] > INACTIVITY_LIMIT:
+        player["inactivity_warned"] = True
+        queue_message(
+            ctx,
+            int(uid),
+            "⚠️ Вы не делали ход более недели. "
+            "Появится риск исключения из игры.",
         )
 
 
+async def check_all_inactive(ctx: ContextTypes.DEFAULT_TYPE) -> None:
+    """Периодическая задача JobQueue: проверяет неактивность всех игроков."""
+    now = time.time()
+    for uid in list(ctx.bot_data["players"]):
+        check_inactivity(uid, ctx, now)
+
+
 # ──────────────────────  Таблица лидеров  ──────────────────────
+def note_score_change(ctx: ContextTypes.DEFAULT_TYPE, uid: str) -> None:
+    """
+    Обновляет ``bot_data["top_scores"]`` – два лучших счёта в виде
+    ``[(score, uid), ...]`` – после изменения очков игрока ``uid``.
+
+    Обычно это O(1); полный пересчёт нужен, только если очки потерял
+    игрок из топа (его место мог занять кто‑то вне топа). Заодно
+    увеличивает ``scores_version`` – версию для кэша таблицы лидеров.
+    """
+    ctx.bot_data["scores_version"] += 1     # сбрасывает кэш таблицы лидеров
+
+    players = ctx.bot_data["players"]
+    old_top = ctx.bot_data["top_scores"]
+    new_score = players[uid]["score"]
+    old_score = next((sc for sc, pid in old_top if pid == uid), None)
+
+    if old_score is not None and new_score < old_score and len(players) > len(old_top):
+        ctx.bot_data["top_scores"] = heapq.nlargest(
+            2, ((p["score"], pid) for pid, p in players.items())
+        )
+        return
+
+    top = [(sc, pid) for sc, pid in old_top if pid != uid]
+    top.append((new_score, uid))
+    top.sort(reverse=True)
+    ctx.bot_data["top_scores"] = top[:2]
+
+
+def best_other_score(ctx: ContextTypes.DEFAULT_TYPE, uid: str) -> int | None:
+    """Лучший счёт среди игроков, кроме ``uid`` (``None`` – других нет)."""
+    return next((sc for sc, pid in ctx.bot_data["top_scores"] if pid != uid), None)
+
+
 def format_score_table(ctx: ContextTypes.DEFAULT_TYPE) -> str:
-    """Возвращает таблицу лидеров в виде markdown‑блока."""
+    """
+    Возвращает таблицу лидеров в виде markdown‑блока.
+
+    Результат кэшируется в ``bot_data["leaderboard_cache"]`` и
+    пересобирается, только если изменились очки (``scores_version``)
+    или текущий игрок.
+    """
     players = ctx.bot_data["players"]
     if not players:
         return "⚙️ Пока никто не играет"
 
-    sorted_players = sorted(players.values(), key=lambda p: p["score"], reverse=True)
     cur_uid = ctx.bot_data["queue"][0] if ctx.bot_data.get("state_game_active") else None
+    key = (ctx.bot_data["scores_version"], cur_uid)
+    cached = ctx.bot_data.get("leaderboard_cache")
+    if cached and cached[0] == key:
+        return cached[1]
+
+    sorted_players = sorted(players.values(), key=lambda p: p["score"], reverse=True)
 
     name_w = max(len(p["username"]) for p in sorted_players)
     score_w = max(len(str(p["score"])) for p in sorted_players)
@@ -246,7 +583,9 @@ def format_score_table(ctx: ContextTypes.DEFAULT_TYPE) -> str:
         lines.append(
             f"{p['username'].ljust(name_w)}  {str(p['score']).rjust(score_w)} {marker}"
         )
-    return "```\n" + "\n".join(lines) + "\n```"
+    table = "```\n" + "\n".join(lines) + "\n```"
+    ctx.bot_data["leaderboard_cache"] = (key, table)
+    return table
 
 
 # ──────────────────────  Команды  ──────────────────────
@@ -279,9 +618,10 @@ async def join(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     ctx.bot_data["players"][uid] = {
         "username": upd.effective_user.username or upd.effective_user.full_name,
         "score": 0,
-        "last_active": datetime.datetime.utcnow().isoformat(),
+        "last_active": int(time.time()),
     }
     ctx.bot_data["queue"].append(uid)
+    note_score_change(ctx, uid)
     await reply(upd, "🤝 Вы присоединились к партии!")
 
 
@@ -296,17 +636,17 @@ async def begin(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     random.shuffle(players)
     ctx.bot_data["queue"] = players
 
-    state = load_json(STATE_PATH)
-    cfg = load_json(CFG_PATH)
+    state = load_state(ctx)
+    cfg = ctx.bot_data["cfg"]
 
     # создаём список зданий, если его нет в состоянии
-    if not state.get("buildings"):
-        state["buildings"] = [
-            {"id": b["id"], "last_attempt": None, "is_closed": False}
+    if not state["buildings_by_id"]:
+        state["buildings_by_id"] = {
+            b["id"]: {"id": b["id"], "last_attempt": None, "is_closed": False}
             for b in cfg.get("buildings", [])
-        ]
+        }
     state["queue"], state["game_state"] = players, "active"
-    save_state(state)
+    persist_state(state, ctx)
 
     ctx.bot_data["state_game_active"] = True
     first = ctx.bot_data["players"][players[0]]["username"]
@@ -345,11 +685,10 @@ async def menu(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     is_my_turn = ctx.bot_data["queue"] and ctx.bot_data["queue"][0] == uid
 
-    # условия для кнопки «Грабить»
-    others = any(pl != uid for pl in ctx.bot_data["players"])
+    # условия для кнопки «Грабить» (топ‑счета ведёт note_score_change)
+    best_other = best_other_score(ctx, uid)
     my_balance = ctx.bot_data["players"][uid]["score"]
-    rich_other = any(p["score"] >= 10 for pid, p in ctx.bot_data["players"].items() if pid != uid)
-    can_steal = is_my_turn and others and my_balance >= 2 and rich_other
+    can_steal = is_my_turn and best_other is not None and my_balance >= 2 and best_other >= 10
 
     # кнопки игрока
     if is_my_turn:
@@ -384,7 +723,7 @@ async def score(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
 @player_or_admin
 async def show_board(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Кнопка «🗺️ Карта» – список всех зданий (доступна админа и игрокам)."""
-    cfg = load_json(CFG_PATH)
+    cfg = ctx.bot_data["cfg"]
 
     rows = [
         [
@@ -414,11 +753,11 @@ async def building_info(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await query.answer("❌ Некорректный запрос", show_alert=True)
         return
 
-    cfg = load_json(CFG_PATH)
-    st = load_json(STATE_PATH)
+    cfg = ctx.bot_data["cfg"]
+    st = load_state(ctx)
 
-    building = next((b for b in cfg.get("buildings", []) if b["id"] == b_id), None)
-    dyn = next((d for d in st.get("buildings", []) if d["id"] == b_id), {})
+    building = cfg["buildings_by_id"].get(b_id)
+    dyn = st["buildings_by_id"].get(b_id, {})
 
     # базовое описание
     caption = f"<b>{html.escape(building['name'])}</b>\n{html.escape(building['story_text'])}"
@@ -434,10 +773,10 @@ async def building_info(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # последняя попытка
     last = dyn.get("last_attempt")
     if last:
-        dt = datetime.datetime.fromisoformat(last["time"]).strftime("%d.%m.%Y %H:%M")
-        verdict = "".join(
-            "🟩" if c == "green" else "🟨" if c == "yellow" else "⬜"
-            for c in compare_word(last["word"], building["target_word"])
+        dt = format_time(last["time"])
+        # visual сохраняется при попытке; пересчёт – только для старых записей
+        verdict = last.get("visual") or render_colours(
+            compare_word(last["word"], building["target_word"])
         )
         caption += (
             f"\n\nПоследняя попытка:\n"
@@ -451,9 +790,12 @@ async def building_info(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
 
     # отправка фото (если есть) или только текста
     photo_name = building.get("photo_file")
-    if photo_name and (PHOTOS_DIR / photo_name).is_file():
-        await query.message.reply_photo(
-            photo=str(PHOTOS_DIR / photo_name),
+    photo_path = PHOTOS_DIR / photo_name if photo_name else None
+    if photo_path and (photo_path.name in ctx.bot_data["photo_ids"] or photo_path.is_file()):
+        await send_cached_photo(
+            query.message.reply_photo,
+            photo_path,
+            ctx,
             caption=caption,
             parse_mode="HTML",
         )
@@ -483,18 +825,18 @@ async def handle_guess_word(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     if len(word) != 5:
         await reply(upd, "❗️ Слово должно быть ровно из 5 букв")
         return
-    if word.lower() not in WORDS:
+    if word not in WORDS_UPPER:
         await reply(upd, "❗️ Слова нет в словаре")
         return
 
-    cfg = load_json(CFG_PATH)
-    building = next((b for b in cfg.get("buildings", []) if b["id"] == b_id), None)
+    cfg = ctx.bot_data["cfg"]
+    building = cfg["buildings_by_id"].get(b_id)
     if not building:
         await reply(upd, "🏚️ Здание не найдено")
         return
 
-    state = load_json(STATE_PATH)
-    dyn = next((d for d in state.get("buildings", []) if d["id"] == b_id), {})
+    state = load_state(ctx)
+    dyn = state["buildings_by_id"].get(b_id) or {"id": b_id}
 
     # повторная попытка
     last = dyn.get("last_attempt")
@@ -510,22 +852,23 @@ async def handle_guess_word(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     # сравнение и начисление очков
     colours = compare_word(word, building["target_word"])
     points = score_from(colours)
+    visual = render_colours(colours)
 
     player = ctx.bot_data["players"][uid]
     player["score"] += points
-    player["last_active"] = datetime.datetime.utcnow().isoformat()
+    note_score_change(ctx, uid)
+    now = int(time.time())
+    player["last_active"] = now
+    player["inactivity_warned"] = False
     dyn["last_attempt"] = {
         "user_id": uid,
         "username": player["username"],
-        "time": datetime.datetime.utcnow().isoformat(),
+        "time": now,
         "word": word,
+        "colours": colours,
+        "visual": visual,
     }
 
-    visual = "".join(
-        "🟩" if c == "green" else "🟨" if c == "yellow" else "⬜"
-        for c in colours
-    )
-
     if word.upper() == building["target_word"].upper():
         dyn["is_closed"] = True
         await reply(
@@ -537,10 +880,8 @@ async def handle_guess_word(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await reply(upd, f"{visual}\n+{points} очков")
 
     # сохраняем состояние и передаём ход
-    state["buildings"] = [
-        d if d["id"] != b_id else dyn for d in state.get("buildings", [])
-    ]
-    save_state(state)
+    state["buildings_by_id"][b_id] = dyn
+    persist_state(state, ctx)
     advance_queue(ctx)
     await menu(upd, ctx)
 
@@ -604,91 +945,81 @@ async def steal_handler(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
             outcome = f"🎲 Выпало {dice}. Не повезло. Минус 2 очка"
             note = f"🚨 @{thief['username']} попытался вас ограбить, но вы не из робкого десятка! Плюс 2 очка"
 
+        note_score_change(ctx, uid)
+        note_score_change(ctx, target_id)
+
         # уведомляем жертву
-        ctx.application.create_task(
-            ctx.application.bot.send_message(chat_id=int(target_id), text=note)
-        )
+        queue_message(ctx, int(target_id), note)
 
-        await reply(upd, outcome)
         advance_queue(ctx)
+        # независимые запросы – параллельно; меню – после ответа о результате
+        await asyncio.gather(reply(upd, outcome), upd.callback_query.answer())
         await menu(upd, ctx)
-        await upd.callback_query.answer()
         return
 
     await upd.callback_query.answer()
 
 
+@admin_only
+async def reload_cfg(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """Перечитывает config.json без перезапуска бота (только админ)."""
+    ctx.bot_data["cfg"] = await asyncio.to_thread(load_cfg)
+    await reply(upd, f"🔁 Конфиг перечитан: зданий – {len(ctx.bot_data['cfg'].get('buildings', []))}")
+
+
 @admin_only
 async def reset_game(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
     """Полностью очищает состояние игры (только админ)."""
-    if STATE_PATH.is_file():
-        STATE_PATH.unlink()
+    # ждём уже запланированные записи, чтобы они не воскресили файл
+    async with STATE_LOCK:
+        await asyncio.to_thread(STATE_PATH.unlink, missing_ok=True)
+    ctx.bot_data.pop(STATE_CACHE_KEY, None)
     ctx.bot_data["players"] = {}
     ctx.bot_data["queue"] = []
+    ctx.bot_data["top_scores"] = []
+    ctx.bot_data["scores_version"] += 1
     ctx.bot_data["state_game_active"] = False
     await reply(upd, "🔄 Игра сброшена. /join – снова в игру")
+    if upd.callback_query:
+        await upd.callback_query.answer()
 
 
 async def rules_command(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    for chunk in RULES_CHUNKS:
-        await reply(upd, chunk, parse_mode="Markdown")
-        await asyncio.sleep(0.2)
-
-    map_path = BASE / "MapNewYork.png"
-    if map_path.is_file():
-        await ctx.application.bot.send_photo(
-            chat_id=upd.effective_chat.id,
-            photo=str(map_path),
-            caption="🗺️ Карта игрового города",
-        )
-    else:
-        logger.warning("Файл карты не найден: %s", map_path)
-        await reply(upd, "⚠️ Картинка карты не найдена")
-
-
-# ──────────────────────  Callback‑handler  ──────────────────────
-async def callback_handler(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
-    data = upd.callback_query.data
+    """
+    Правила и карта города. Части правил уходят строго по порядку,
+    загрузка карты идёт параллельно с ними.
+    """
+    async def _send_rules():
+        for chunk in RULES_CHUNKS:
+            await send_with_retry(lambda c=chunk: reply(upd, c, parse_mode="Markdown"))
+
+    async def _send_map():
+        if MAP_PATH.name in ctx.bot_data["photo_ids"] or MAP_PATH.is_file():
+            await send_with_retry(
+                lambda: send_cached_photo(
+                    functools.partial(ctx.application.bot.send_photo, chat_id=upd.effective_chat.id),
+                    MAP_PATH,
+                    ctx,
+                    caption="🗺️ Карта игрового города",
+                )
+            )
+        else:
+            logger.warning("Файл карты не найден: %s", MAP_PATH)
+            await reply(upd, "⚠️ Картинка карты не найдена")
 
-    # если пользователь переключился из режима «угадывать слово», сбрасываем маркер
-    if ctx.user_data.get("guess_building_id") and not (data in ("guess",) or data.startswith("guess:")):
-        ctx.user_data.pop("guess_building_id", None)
+    await asyncio.gather(_send_rules(), _send_map())
 
-    handlers = {
-        "reset_game": reset_game,
-        "menu": menu,
-        "score": score,
-        "show_board": show_board,
-        "steal": steal_handler,
-        "building": building_info,
-    }
 
-    # ---------- УГАДЫВАНИЕ ----------
-    if data == "guess":
-        cfg = load_json(CFG_PATH)
-        state = load_json(STATE_PATH)
-        rows = []
-        for b in cfg.get("buildings", []):
-            dyn = next((d for d in state.get("buildings", []) if d["id"] == b["id"]), {})
-            if dyn.get("is_closed"):
-                continue
-            rows.append(
-                [InlineKeyboardButton(f"{b['name']} (ID {b['id']})", callback_data=f"guess:{b['id']}")]
-            )
-        if not rows:
-            await reply(upd, "❌ Все здания уже закрыты")
-            await upd.callback_query.answer()
-            return
-        rows.append([InlineKeyboardButton("↩️ В меню", callback_data="menu")])
-        await upd.callback_query.message.reply_text(
-            "Выберите место для угадывания:",
-            reply_markup=InlineKeyboardMarkup(rows),
-        )
-        await upd.callback_query.answer()
-        return
+# ──────────────────────  Callback‑handler  ──────────────────────
+async def guess_handler(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    """
+    «guess» – список открытых зданий для угадывания;
+    «guess:<id>» – запоминает выбранное здание и ждёт ввода слова.
+    """
+    _, _, arg = upd.callback_query.data.partition(":")
 
-    if data.startswith("guess:"):
-        ctx.user_data["guess_building_id"] = int(data.split(":")[1])
+    if arg:
+        ctx.user_data["guess_building_id"] = int(arg)
         await upd.callback_query.message.reply_text(
             "Введите слово (5 букв):",
             reply_markup=InlineKeyboardMarkup(
@@ -698,37 +1029,81 @@ async def callback_handler(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
         await upd.callback_query.answer()
         return
 
-    # ---------- ГРАБЁЖ ----------
-    if data.startswith("steal:"):
-        await steal_handler(upd, ctx)
-        return
-
-    # ---------- ЗДАНИЕ ----------
-    if data.startswith("building:"):
-        await building_info(upd, ctx)
+    cfg = ctx.bot_data["cfg"]
+    state_by_id = load_state(ctx)["buildings_by_id"]
+    rows = [
+        [InlineKeyboardButton(f"{b['name']} (ID {b['id']})", callback_data=f"guess:{b['id']}")]
+        for b in cfg.get("buildings", [])
+        if not state_by_id.get(b["id"], {}).get("is_closed")
+    ]
+    if not rows:
+        await reply(upd, "❌ Все здания уже закрыты")
         await upd.callback_query.answer()
         return
+    rows.append([InlineKeyboardButton("↩️ В меню", callback_data="menu")])
+    await upd.callback_query.message.reply_text(
+        "Выберите место для угадывания:",
+        reply_markup=InlineKeyboardMarkup(rows),
+    )
+    await upd.callback_query.answer()
 
-    # ---------- ОСТАЛЬНОЕ ----------
-    if data in handlers:
-        await handlers[data](upd, ctx)
-        await upd.callback_query.answer()
-        return
+
+# префикс callback_data (до «:») → (обработчик, нужен ли answer() после него)
+CALLBACK_HANDLERS = {
+    "guess": (guess_handler, False),
+    "steal": (steal_handler, False),
+    "building": (building_info, False),
+    "show_board": (show_board, False),
+    "menu": (menu, True),
+    "score": (score, True),
+    "reset_game": (reset_game, False),
+}
+
+
+async def callback_handler(upd: Update, ctx: ContextTypes.DEFAULT_TYPE):
+    kind = upd.callback_query.data.split(":", 1)[0]
+
+    # если пользователь переключился из режима «угадывать слово», сбрасываем маркер
+    if kind != "guess":
+        ctx.user_data.pop("guess_building_id", None)
+
+    handler, answer_after = CALLBACK_HANDLERS.get(kind, (None, True))
+    if handler:
+        await handler(upd, ctx)
 
     # неизвестный запрос – просто answer, чтобы Telegram не ругался
-    await upd.callback_query.answer()
+    if answer_after:
+        await upd.callback_query.answer()
 
 
 # ──────────────────────  Точка входа  ──────────────────────
 def main() -> None:
     """Запуск бота."""
-    app = ApplicationBuilder().token(BOT_TOKEN).build()
+    # uvloop – более быстрый event loop (на Windows недоступен)
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        logger.info("uvloop не установлен – используется стандартный asyncio loop")
+
+    # post_stop, а не post_shutdown: после shutdown() бот уже не может отправлять
+    app = ApplicationBuilder().token(BOT_TOKEN).post_stop(drain_send_tasks).build()
 
     # глобальные данные
     app.bot_data["admin_id"] = ADMIN_ID
     app.bot_data["players"] = {}
+    app.bot_data["top_scores"] = []
+    app.bot_data["scores_version"] = 0
     app.bot_data["queue"] = []
     app.bot_data["state_game_active"] = False
+    app.bot_data["state_pending_writes"] = 0
+    app.bot_data["photo_ids"] = load_json(PHOTO_IDS_PATH)
+    # очереди уведомлений (см. queue_message)
+    app.bot_data["chat_outbox"] = {}
+    app.bot_data["chat_last_send"] = {}
+    app.bot_data["send_tasks"] = set()
+    app.bot_data["send_next_global"] = 0.0
+    app.bot_data["cfg"] = load_cfg()
 
     # команды
     app.add_handler(CommandHandler("start", start))
@@ -737,11 +1112,25 @@ def main() -> None:
     app.add_handler(CommandHandler("menu", menu))
     app.add_handler(CommandHandler("score", score))
     app.add_handler(CommandHandler("rules", rules_command))
+    app.add_handler(CommandHandler("reload", reload_cfg))
 
     # обработчики
     app.add_handler(CallbackQueryHandler(callback_handler))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_guess_word))
     app.add_error_handler(universal_error_handler)
+
+    # периодическая проверка неактивных игроков
+    if app.job_queue:
+        app.job_queue.run_repeating(
+            check_all_inactive,
+            interval=INACTIVITY_CHECK_INTERVAL,
+            first=INACTIVITY_CHECK_INTERVAL,
+        )
+    else:
+        logger.warning(
+            "JobQueue недоступна (нужен python-telegram-bot[job-queue]) – "
+            "проверка неактивности отключена"
+        )
     
      # --------------------  запуск HTTP‑сервера в фоне ------------
     async def _run_http():
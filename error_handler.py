@@ -10,9 +10,9 @@ error_handler.py – универсальный обработчик ошибо
 """
 
 import os
+import time
+import html
 import logging
-import traceback
-import asyncio
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.error import Conflict, TelegramError
@@ -21,6 +21,27 @@ from telegram.error import Conflict, TelegramError
 logger = logging.getLogger(__name__)          # будет наследовать конфиг из bot.py
 # ----------------------------------------------------------------------
 
+# ADMIN_ID читается один раз – при первой ошибке, а не при импорте:
+# bot.py импортирует этот модуль раньше, чем загружает .env.
+_ADMIN_ID: int | None = None
+
+# ограничение частоты оповещений админа
+_NOTIFY_INTERVAL = 30.0                       # секунд между оповещениями
+_last_notify_ts = float("-inf")
+
+# шаблон оповещения; трассировка обрезается под лимит сообщения Telegram
+_ADMIN_PREFIX = "🚨 <b>Bot error</b>:\n<pre>"
+_ADMIN_SUFFIX = "</pre>"
+_ADMIN_TB_LIMIT = 4000                        # с запасом до 4096 (эмодзи, «…»)
+
+
+def _admin_id() -> int:
+    """Возвращает ADMIN_ID из окружения (0 – оповещения выключены), с кэшем."""
+    global _ADMIN_ID
+    if _ADMIN_ID is None:
+        _ADMIN_ID = int(os.getenv("ADMIN_ID", "0") or "0")
+    return _ADMIN_ID
+
 
 async def universal_error_handler(
     update: Update | None,
@@ -32,8 +53,11 @@ async def universal_error_handler(
     • TelegramError – логируем как ошибку бота.
     • Всё остальное – логируем полную трассировку и (по желанию) оповещаем админа.
     """
+    # asyncio нужен только при ошибке – импортируем здесь, а не при старте
+    # бота (повторный import берётся из sys.modules)
+    import asyncio
+
     exc = context.error                       # тип – Exception
-    tb_str = "".join(traceback.format_exception(type(exc), exc, exc.__traceback__))
 
     # --------------------------------------------------------------
     # 1️⃣ Конфликт getUpdates (одновременно запущено 2+ процесса)
@@ -41,10 +65,11 @@ async def universal_error_handler(
     if isinstance(exc, Conflict):
         # Это обычный «мельтешный» конфликт в Render, когда старый процесс
         # ещё держит запрос, а уже запущен новый.
+        # Трассировка здесь не нужна – достаточно самого исключения.
         logger.warning(
             "⚠️ Conflict while getUpdates – another instance is probably still "
-            "running. Ignoring and will retry. Details:\n%s",
-            tb_str,
+            "running. Ignoring and will retry. Details: %r",
+            exc,
         )
         # Пауза даёт старому процессу шанс корректно завершиться.
         await asyncio.sleep(2)
@@ -54,26 +79,44 @@ async def universal_error_handler(
     # 2️⃣ Ошибки Telegram API (таймауты, 429, BadRequest и т.п.)
     # --------------------------------------------------------------
     if isinstance(exc, TelegramError):
-        logger.error(
-            "❌ TelegramError: %s\n%s",
-            getattr(exc, "message", "<no message>"),
-            tb_str,
-        )
+        try:
+            msg = exc.message                 # у TelegramError атрибут есть всегда
+        except AttributeError:
+            msg = "<no message>"
+        # exc_info – трассировку форматирует logging и только если запись будет выведена;
+        # форматирование и запись в обработчики идут в потоке, не блокируя event loop
+        await asyncio.to_thread(logger.error, "❌ TelegramError: %s", msg, exc_info=exc)
     else:
         # --------------------------------------------------------------
         # 3️⃣ Любые другие (код‑баги, ошибки в наших функциях)
         # --------------------------------------------------------------
-        logger.error("🚨 Unhandled exception in handler:\n%s", tb_str)
+        await asyncio.to_thread(logger.error, "🚨 Unhandled exception in handler", exc_info=exc)
 
     # --------------------------------------------------------------
     # 4️⃣ Оповещение администратора (по желанию)
     # --------------------------------------------------------------
-    admin_id = int(os.getenv("ADMIN_ID", "0"))
+    admin_id = _admin_id()
     if admin_id:
+        # не чаще раза в _NOTIFY_INTERVAL: при «шторме» ошибок (например, 429)
+        # сами оповещения иначе упрутся в лимиты и породят новые ошибки
+        global _last_notify_ts
+        now = time.monotonic()
+        if now - _last_notify_ts < _NOTIFY_INTERVAL:
+            return
+        _last_notify_ts = now
+
+        # traceback – только для уведомления админа, импортируем здесь
+        import traceback
+        # кадры обходятся один раз – при создании TracebackException
+        te = traceback.TracebackException.from_exception(exc)
+        tb_str = "".join(te.format())
+        # лимит Telegram – 4096 символов; важнее конец трассировки
+        if len(tb_str) > _ADMIN_TB_LIMIT:
+            tb_str = "…" + tb_str[-_ADMIN_TB_LIMIT:]
         try:
             await context.bot.send_message(
                 chat_id=admin_id,
-                text=f"🚨 <b>Bot error</b>:\n<pre>{tb_str}</pre>",
+                text=_ADMIN_PREFIX + html.escape(tb_str) + _ADMIN_SUFFIX,
                 parse_mode="HTML",
             )
         except Exception as send_exc:
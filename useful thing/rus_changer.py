@@ -14,16 +14,23 @@
     5. Сохраняет результат в файл **New_rus.txt** в той же директории.
 
 Требования:
-    * Python 3.6+ (используется only built‑in modules)
+    * Python 3.9+ (используется only built‑in modules)
     * Файл должен быть в кодировке UTF‑8 (стандарт для современных
       русскоязычных проектов). При необходимости поменяйте параметр
       `encoding`.
 """
 
+import os
 import sys
 from pathlib import Path
 
 
+# UTF‑8 коды «ё», «Ё» и «Е» для замены во всём буфере
+_YO_LOWER = "ё".encode("utf-8")
+_YO_UPPER = "Ё".encode("utf-8")
+_YE_UPPER = "Е".encode("utf-8")
+
+
 def read_input_path() -> Path:
     """
     Возвращает объект Path с именем исходного файла.
@@ -37,32 +44,59 @@ def read_input_path() -> Path:
         return Path(inp)
 
 
+def read_raw(path: Path) -> bytes:
+    """
+    Возвращает содержимое файла, прочитанное через os.read – одним
+    системным вызовом на весь размер файла (os.fstat), без буферов
+    BufferedReader/TextIOWrapper. Если прочитано меньше (или файл вырос),
+    дочитываем до конца.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        data = os.read(fd, os.fstat(fd).st_size)
+        while chunk := os.read(fd, 1 << 16):
+            data += chunk
+        return data
+    finally:
+        os.close(fd)
+
+
+def write_raw(path: Path, data: bytes) -> None:
+    """
+    Записывает data в файл напрямую через os.write – без промежуточных
+    буферов TextIOWrapper/BufferedWriter. os.write может записать не всё
+    сразу, поэтому пишем остаток, пока он есть.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
 def process_file(src_path: Path, dst_path: Path) -> None:
     """
     Читает src_path → список слов → преобразует их → пишет в dst_path.
     """
-    # При чтении/записи явно указываем UTF‑8, чтобы правильно работать с ё/Ё.
-    with src_path.open("r", encoding="utf-8") as src:
-        # Сохраняем порядок появления слов, убирая дубликаты.
-        seen = set()
-        result = []                       # список уникальных слов в нужном порядке
-        for line in src:
-            word = line.strip()          # убираем перевод строки и пробелы по краям
-            if not word:                  # пустая строка – игнорируем
-                continue
-            # 1) переводим в верхний регистр
-            word = word.upper()
-            # 2) заменяем Ё на Е
-            word = word.replace("Ё", "Е")
-            # 3) удаляем дубликаты (первое вхождение оставляем)
-            if word not in seen:
-                seen.add(word)
-                result.append(word)
-
-    # Записываем результат
-    with dst_path.open("w", encoding="utf-8", newline="\n") as dst:
-        for w in result:
-            dst.write(w + "\n")
+    # 1) Файл читается одним os.read; «ё»/«Ё» → «Е» сразу во всём буфере
+    #    (байты D0/D1 в UTF‑8 всегда начинают символ, так что замена точна).
+    data = read_raw(src_path).replace(_YO_LOWER, _YE_UPPER).replace(_YO_UPPER, _YE_UPPER)
+
+    # 2) Убираем точные повторы строк и пустые строки ещё в байтах –
+    #    дубликаты незачем декодировать (dict.fromkeys сохраняет порядок).
+    raw_unique = dict.fromkeys(filter(None, map(bytes.strip, data.splitlines())))
+
+    # 3) Декодируем, str.strip() (добирает, например, неразрывный пробел),
+    #    upper() и повторно убираем дубликаты («ёлка» и «ЕЛКА» совпали).
+    result = list(dict.fromkeys(filter(None, (
+        line.decode("utf-8").strip().upper() for line in raw_unique
+    ))))
+
+    # 4) Пишем одним буфером; пустой элемент даёт завершающий "\n".
+    out = "\n".join(result + [""]) if result else ""
+    write_raw(dst_path, out.encode("utf-8"))
 
 
 def main() -> None: